@@ -5,47 +5,233 @@ A conversational AI assistant powered by Llama 3.2 with persistent memory
 """
 
 import os
-import json
+import re
+import math
+import heapq
 import uuid
 import time
+import atexit
+import queue
+import threading
 import subprocess
-from typing import Optional, List, Tuple
+from collections import Counter, deque
+from typing import AbstractSet, Iterator, Optional, List, Tuple
 
 import ollama
+import orjson
 from gtts import gTTS
 import gradio as gr
 
 # =============== CONFIGURATION ===============
 MODEL_NAME = "llama3.2"
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+MODEL_OPTIONS = {"num_ctx": 8192, "num_predict": 512}  # Default ctx is 2048 and truncates silently
+KEEP_ALIVE = "30m"  # Keep the model loaded between replies
 BASE_DIR = os.path.join(os.path.expanduser("~"), "jd_data")  # Local storage
 os.makedirs(BASE_DIR, exist_ok=True)
 
 CONV_PATH = os.path.join(BASE_DIR, "conversations.json")  # Per-topic chats
 FLAT_PATH = os.path.join(BASE_DIR, "train.jsonl")         # Flat log for training
+METRICS_PATH = os.path.join(BASE_DIR, "metrics.jsonl")    # Ollama latency / throughput
+
+DISPLAY_TURNS = 20  # Turns rendered in the chat; the full history stays in State
 
 AUDIO_DIR = "audio"
 os.makedirs(AUDIO_DIR, exist_ok=True)
 
+CLIENT = ollama.Client(host=OLLAMA_HOST)  # One client, reused for every request
+
 # =============== DATA MANAGEMENT ===============
 
+class DiskWriter:
+    """Background thread that batches JSONL appends off the reply path."""
+
+    def __init__(self, keep_open: AbstractSet[str] = frozenset()):
+        self._queue = queue.Queue()
+        self._keep_open = keep_open  # Paths written every turn get one long-lived handle
+        self._files = {}  # path -> long-lived append handle
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, path: str, line: bytes) -> None:
+        """Queue a line to be appended to path."""
+        self._queue.put((path, line))
+
+    def close(self) -> None:
+        """Write everything still queued, stop the thread and close files."""
+        self._queue.put(None)
+        self._thread.join()
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+    def _run(self) -> None:
+        running = True
+        while running:
+            # Block for one item, then drain whatever else is pending
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            pending = {}
+            for item in batch:
+                if item is None:
+                    running = False
+                    continue
+                path, line = item
+                pending.setdefault(path, []).append(line)
+
+            # One write per file for the whole batch; only the shared logs
+            # stay open, so per-conversation logs do not pile up handles
+            for path, lines in pending.items():
+                try:
+                    if path in self._keep_open:
+                        f = self._files.get(path)
+                        if f is None:
+                            f = open(path, "ab")
+                            self._files[path] = f
+                        f.write(b"".join(lines))
+                        f.flush()  # Buffered writer retries short writes
+                    else:
+                        with open(path, "ab") as f:
+                            f.write(b"".join(lines))
+                except Exception as e:
+                    print(f"Write error ({path}): {e}")
+
+
+WRITER = DiskWriter(keep_open={FLAT_PATH, METRICS_PATH})
+
+
+def conv_log_path(conv_id: str) -> str:
+    """Path of the append-only turn log for one conversation."""
+    return os.path.join(BASE_DIR, f"conv_{conv_id}.jsonl")
+
+
+# Exit snapshot guards: conversations.json is only rewritten when it loaded
+# cleanly and a turn was added or folded in since
+_snapshot_blocked = False
+_snapshot_dirty = False
+
+
+def load_snapshot(path: str) -> Tuple[List[dict], int]:
+    """
+    Parse the snapshot one conversation per line, as written by
+    save_conversations. Returns the conversations and the number of
+    unreadable lines that were skipped.
+    """
+    convs = []
+    skipped = 0
+    with open(path, "rb") as f:
+        for i, line in enumerate(f):
+            line = line.strip().rstrip(b",")
+            if i == 0 and line == b"[":
+                continue
+            if line in (b"", b"]"):
+                continue
+            try:
+                conv = orjson.loads(line) if i else None
+            except ValueError:
+                conv = None
+            if not isinstance(conv, dict):
+                if i <= 1:
+                    # Older (indented) snapshot: fall back to a whole-file parse
+                    f.seek(0)
+                    data = orjson.loads(f.read())
+                    return (data if isinstance(data, list) else []), 0
+                skipped += 1  # Skip a line torn by a crash
+                continue
+            convs.append(conv)
+    return convs, skipped
+
+
 def load_conversations(path: str = CONV_PATH) -> List[dict]:
-    """Load all conversations from JSON file."""
-    if not os.path.exists(path):
-        return []
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, list):
-                return data
-    except Exception as e:
-        print(f"Error loading conversations: {e}")
-    return []
+    """Load the conversations snapshot, then fold in per-turn JSONL logs."""
+    global _snapshot_blocked, _snapshot_dirty
+
+    convs = []
+    if os.path.exists(path):
+        try:
+            convs, skipped = load_snapshot(path)
+            if skipped:
+                # Keep the damaged lines on disk rather than dropping them
+                _snapshot_blocked = True
+                print(f"Skipped {skipped} unreadable line(s) in {path}")
+        except Exception as e:
+            # Keep the file (and the turn logs) untouched for manual recovery
+            _snapshot_blocked = True
+            print(f"Error loading conversations: {e}")
+
+    # Turns appended since the last snapshot live in conv_<id>.jsonl
+    records = []
+    for name in os.listdir(BASE_DIR):
+        if not (name.startswith("conv_") and name.endswith(".jsonl")):
+            continue
+        try:
+            with open(os.path.join(BASE_DIR, name), "rb") as f:
+                for line in f:
+                    try:
+                        records.append(orjson.loads(line))
+                    except ValueError:
+                        continue  # Skip a line torn by a crash
+        except Exception as e:
+            print(f"Error loading {name}: {e}")
+
+    # log_ts is the timestamp of the last logged turn already in the
+    # snapshot, so logs that outlive a snapshot are never folded twice
+    by_id = {c["id"]: c for c in convs}
+    for rec in sorted(records, key=lambda r: r.get("ts", 0)):
+        conv = by_id.get(rec["conv_id"])
+        if conv is None:
+            conv = {"id": rec["conv_id"], "title": rec["title"], "turns": []}
+            by_id[conv["id"]] = conv
+            convs.append(conv)
+        elif rec.get("ts", 0) <= conv.get("log_ts", 0):
+            continue
+        conv["title"] = rec["title"]
+        conv["turns"].append([rec["user"], rec["assistant"]])
+        conv["log_ts"] = rec.get("ts", 0)
+        _snapshot_dirty = True
+    return convs
 
 
 def save_conversations(convs: List[dict], path: str = CONV_PATH) -> None:
-    """Save all conversations to JSON file."""
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(convs, f, ensure_ascii=False, indent=2)
+    """Snapshot all conversations to JSON and drop the folded turn logs."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        # Encode one conversation at a time so the whole history is never
+        # held as a single buffer; one conversation per line
+        f.write(b"[")
+        for i, conv in enumerate(convs):
+            f.write(b",\n" if i else b"\n")
+            f.write(orjson.dumps(conv))
+        f.write(b"\n]\n")
+    os.replace(tmp_path, path)
+    # Safe to fail: the log_ts watermark keeps these from being folded again
+    for conv in convs:
+        log_path = conv_log_path(conv["id"])
+        try:
+            if os.path.exists(log_path):
+                os.remove(log_path)
+        except OSError as e:
+            print(f"Could not remove {log_path}: {e}")
+
+
+def append_turn(conv: dict, user_text: str, assistant_text: str) -> None:
+    """Append a single turn to the conversation's JSONL log."""
+    global _snapshot_dirty
+    rec = {
+        "conv_id": conv["id"],
+        "title": conv["title"],
+        "user": user_text,
+        "assistant": assistant_text,
+        "ts": time.time(),
+    }
+    conv["log_ts"] = rec["ts"]  # Watermark saved with the snapshot
+    _snapshot_dirty = True
+    WRITER.submit(conv_log_path(conv["id"]), orjson.dumps(rec) + b"\n")
 
 
 def log_flat_pair(user_text: str, assistant_text: str, path: str = FLAT_PATH) -> None:
@@ -53,51 +239,168 @@ def log_flat_pair(user_text: str, assistant_text: str, path: str = FLAT_PATH) ->
     if not user_text or not assistant_text:
         return
     rec = {"instruction": user_text, "output": assistant_text}
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    WRITER.submit(path, orjson.dumps(rec) + b"\n")
+
+
+def _ns_to_ms(ns: Optional[int]) -> Optional[float]:
+    """Convert an Ollama duration (nanoseconds) to milliseconds."""
+    return round(ns / 1e6, 1) if ns else None
+
+
+def log_metrics(conv_id: str, stats, path: str = METRICS_PATH) -> None:
+    """Log Ollama timings and token counts from the final chunk of a reply."""
+    eval_count = stats.get("eval_count") or 0
+    eval_ns = stats.get("eval_duration") or 0
+    rec = {
+        "ts": time.time(),
+        "conv_id": conv_id,
+        "model": MODEL_NAME,
+        "prompt_tokens": stats.get("prompt_eval_count"),
+        "prompt_eval_ms": _ns_to_ms(stats.get("prompt_eval_duration")),
+        "eval_tokens": eval_count,
+        "eval_ms": _ns_to_ms(eval_ns),
+        "load_ms": _ns_to_ms(stats.get("load_duration")),
+        "total_ms": _ns_to_ms(stats.get("total_duration")),
+        "tokens_per_s": round(eval_count / (eval_ns / 1e9), 2) if eval_ns else None,
+    }
+    WRITER.submit(path, orjson.dumps(rec) + b"\n")
 
 
 # =============== MEMORY SYSTEM ===============
 
 conversations = load_conversations()  # Load all topics on startup
+_topic_titles = [c["title"] for c in conversations]  # Kept in step with conversations
+_by_id = {c["id"]: c for c in conversations}
+_by_title = {}
+for _conv in conversations:
+    _by_title.setdefault(_conv["title"], _conv)  # First match wins, as before
+
+
+def add_conversation(conv: dict) -> None:
+    """Append a new conversation and index it."""
+    conversations.append(conv)
+    _topic_titles.append(conv["title"])
+    _by_id[conv["id"]] = conv
+    _by_title.setdefault(conv["title"], conv)
+
+
+def shutdown() -> None:
+    """Flush queued log writes, then snapshot conversations if anything changed."""
+    WRITER.close()
+    if _snapshot_blocked:
+        print(f"Skipping snapshot: {CONV_PATH} did not load cleanly; turn logs are kept")
+        return
+    if _snapshot_dirty:
+        save_conversations(conversations)
+
+
+atexit.register(shutdown)
+
+
+MEMORY_TOP_N = 8  # Past turns included as context
+MAX_TAIL_TURNS = 4  # Turns of the active chat sent verbatim
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens used for memory retrieval."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def format_turn(user_text: str, assistant_text: str) -> str:
+    """Format one turn the way it appears in the memory block."""
+    return f"User: {user_text}\nAssistant: {assistant_text}"
+
+
+class MemoryIndex:
+    """Incremental BM25 (Okapi) index over past conversation turns."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.texts = []      # Formatted turn per document
+        self.lengths = []    # Token count per document
+        self.postings = {}   # term -> list of (doc_id, term_freq)
+        self.total_len = 0
+
+    def add(self, user_text: str, assistant_text: str) -> None:
+        """Index one turn; only touches the terms of that turn."""
+        doc_id = len(self.texts)
+        tokens = tokenize(user_text) + tokenize(assistant_text)
+        self.texts.append(format_turn(user_text, assistant_text))
+        self.lengths.append(len(tokens))
+        self.total_len += len(tokens)
+        for term, tf in Counter(tokens).items():
+            self.postings.setdefault(term, []).append((doc_id, tf))
+
+    def top_n(self, query: str, n: int, skip: AbstractSet[str] = frozenset()) -> List[int]:
+        """Return ids of the n best-scoring turns (ignoring texts in skip), oldest first."""
+        if not self.texts:
+            return []
+        n_docs = len(self.texts)
+        avg_len = self.total_len / n_docs or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = math.log((n_docs - df + 0.5) / (df + 0.5) + 1.0)
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        if skip:
+            scores = {d: sc for d, sc in scores.items() if self.texts[d] not in skip}
+        best = heapq.nlargest(n, scores, key=scores.get)
+        return sorted(best)
+
+
+memory_index = MemoryIndex()
+
+# Most recent turns (pre-formatted), used when nothing in memory matches
+recent_mem = deque(maxlen=MEMORY_TOP_N)
+
+for _conv in conversations:
+    for u, b in _conv.get("turns", []):
+        memory_index.add(u, b)
+        recent_mem.append(format_turn(u, b))
+
+SYSTEM_MSG = {
+    "role": "system",
+    "content": (
+        "You are JD, an AI Assistant created by Kunal Debnath Sir. "
+        "You remember previous chats and stay friendly and concise."
+    ),
+}
 
 
-def all_memory_pairs() -> List[dict]:
-    """Flatten all conversations into instruction/output pairs."""
-    mem = []
-    for conv in conversations:
-        for u, b in conv.get("turns", []):
-            mem.append({"instruction": u, "output": b})
-    return mem
+def remember_turn(user_text: str, assistant_text: str) -> None:
+    """Add a finished turn to memory."""
+    memory_index.add(user_text, assistant_text)
+    recent_mem.append(format_turn(user_text, assistant_text))
 
 
-def build_messages_from_memory() -> List[dict]:
-    """Build message context including system prompt and recent memory."""
-    system_msg = {
-        "role": "system",
-        "content": (
-            "You are JD, an AI Assistant created by Kunal Debnath Sir. "
-            "You remember previous chats and stay friendly and concise."
-        ),
-    }
-    
-    mem_pairs = all_memory_pairs()
-    mem_texts = []
-    
-    # Include last 50 conversation turns as context
-    for p in mem_pairs[-50:]:
-        mem_texts.append(f"User: {p['instruction']}\nAssistant: {p['output']}")
-    
-    block = "\n\n".join(mem_texts) if mem_texts else ""
-    
+def build_messages_from_memory(query: str, skip: AbstractSet[str] = frozenset()) -> List[dict]:
+    """
+    Build message context including system prompt and the past turns most
+    relevant to query. Turns whose formatted text is in skip (already sent
+    verbatim) are left out of the memory block.
+    """
+    hits = memory_index.top_n(query, MEMORY_TOP_N, skip)
+    if hits:
+        block = "\n\n".join(memory_index.texts[i] for i in hits)
+    else:
+        block = "\n\n".join(t for t in recent_mem if t not in skip)
+
     if block:
         memory_msg = {
             "role": "system",
             "content": "Here is a summary of past conversation turns:\n\n" + block,
         }
-        return [system_msg, memory_msg]
-    
-    return [system_msg]
+        return [SYSTEM_MSG, memory_msg]
+
+    return [SYSTEM_MSG]
 
 
 # =============== UTILITIES ===============
@@ -123,7 +426,7 @@ def extract_title_from_history(history: List[List[str]]) -> str:
     first_user = history[0][0].strip()
     if not first_user:
         return "New chat"
-    words = first_user.split()
+    words = first_user.split(None, 10)  # Stop splitting once we know it is long
     short = " ".join(words[:10])
     return short + ("…" if len(words) > 10 else "")
 
@@ -132,77 +435,93 @@ def extract_title_from_history(history: List[List[str]]) -> str:
 
 def jd_reply_core(
     user_input: str,
-    speak: bool,
     ui_history: List[List[str]],
     conv_id: Optional[str]
-) -> Tuple[List[List[str]], Optional[str], Optional[str], List[str]]:
+) -> Iterator[Tuple[List[List[str]], Optional[str], Optional[str], List[str]]]:
     """
-    Process user input and generate AI response.
+    Process user input and stream the AI response.
+
+    Text-to-speech is left to the caller so the reply can be shown first.
     
     Args:
         user_input: User's message
-        speak: Whether to generate TTS audio
         ui_history: Current conversation history
         conv_id: ID of active conversation or None for new
         
-    Returns:
-        Tuple of (updated_history, audio_path, conversation_id, topic_titles)
+    Yields:
+        Tuple of (updated_history, answer, conversation_id, topic_titles).
+        answer is None while the reply is still streaming, and
+        updated_history is then only the last DISPLAY_TURNS turns plus the
+        partial reply. The last item carries the finished answer and the
+        full stored history.
     """
     global conversations
 
     user_input = user_input.strip()
     if not user_input:
-        titles = [c["title"] for c in conversations]
-        return ui_history, None, conv_id, titles
+        yield ui_history, None, conv_id, _topic_titles
+        return
+
+    conv = _by_id.get(conv_id) if conv_id is not None else None
+
+    # Only the last few turns of this chat go in verbatim; older ones are
+    # reachable through the memory block, which skips the verbatim ones
+    tail = (conv["turns"] if conv is not None else ui_history)[-MAX_TAIL_TURNS:]
+    skip = {format_turn(u, b) for u, b in tail}
 
     # Build context from all past conversations
-    messages = build_messages_from_memory()
+    messages = build_messages_from_memory(user_input, skip)
 
     # Add current conversation turns
-    for u, b in ui_history:
+    for u, b in tail:
         messages.append({"role": "user", "content": u})
         messages.append({"role": "assistant", "content": b})
     messages.append({"role": "user", "content": user_input})
 
-    # Get AI response
+    # The reply streams into a local turn; nothing is stored until the
+    # stream finishes, so an abandoned stream leaves no half-written turn
+    turn = [user_input, ""]
+    shown = (conv["turns"] if conv is not None else ui_history)[-DISPLAY_TURNS:] + [turn]
+
+    # Stream AI response; the last chunk (done=True) carries the timings
+    final = None
     try:
-        res = ollama.chat(model=MODEL_NAME, messages=messages)
-        answer = res["message"]["content"]
+        stream = CLIENT.chat(
+            model=MODEL_NAME,
+            messages=messages,
+            options=MODEL_OPTIONS,
+            keep_alive=KEEP_ALIVE,
+            stream=True,
+        )
+        for chunk in stream:
+            turn[1] += chunk["message"]["content"]
+            if chunk.get("done"):
+                final = chunk
+            yield shown, None, conv_id, _topic_titles
     except Exception as e:
-        answer = f"Ollama error: {e}"
-
-    ui_history = ui_history + [[user_input, answer]]
+        turn[1] = f"Ollama error: {e}"
+    answer = turn[1]
 
-    # Update or create conversation
-    if conv_id is None:
-        conv_id = str(uuid.uuid4())
-        title = extract_title_from_history(ui_history)
-        new_conv = {"id": conv_id, "title": title, "turns": ui_history.copy()}
-        conversations.append(new_conv)
+    # Update or create conversation; the turn is appended in place and the
+    # stored list is handed back as the new history (no per-turn copies)
+    if conv is not None:
+        conv["turns"].append(turn)
     else:
-        # Update existing conversation
-        found = False
-        for conv in conversations:
-            if conv["id"] == conv_id:
-                conv["turns"] = ui_history.copy()
-                conv["title"] = extract_title_from_history(ui_history)
-                found = True
-                break
-        if not found:
-            # Fallback: create new if ID missing
-            conv_id = str(uuid.uuid4())
-            title = extract_title_from_history(ui_history)
-            conversations.append({"id": conv_id, "title": title, "turns": ui_history.copy()})
+        # New chat, or fallback when the ID is missing
+        conv_id = str(uuid.uuid4())
+        turns = ui_history + [turn]
+        conv = {"id": conv_id, "title": extract_title_from_history(turns), "turns": turns}
+        add_conversation(conv)
+    ui_history = conv["turns"]
 
     # Save to disk
-    save_conversations(conversations)
+    append_turn(conv, user_input, answer)
     log_flat_pair(user_input, answer)
+    if final is not None:
+        log_metrics(conv_id, final)
+    remember_turn(user_input, answer)
 
-    # Generate TTS if requested
-    audio = make_tts(answer) if speak else None
-    titles = [c["title"] for c in conversations]
-    
-    return ui_history, audio, conv_id, titles
+    yield ui_history, answer, conv_id, _topic_titles
 
 
 def load_conversation_by_title(title: str) -> Tuple[List[List[str]], Optional[str]]:
@@ -210,9 +529,9 @@ def load_conversation_by_title(title: str) -> Tuple[List[List[str]], Optional[st
     if not title:
         return [], None
     
-    for conv in conversations:
-        if conv["title"] == title:
-            return conv["turns"], conv["id"]
+    conv = _by_title.get(title)
+    if conv is not None:
+        return conv["turns"], conv["id"]
     
     return [], None
 
@@ -550,7 +869,9 @@ def build_ui():
     
     with gr.Blocks(css=CUSTOM_CSS, title="JD Assistant") as demo:
         active_conv_id = gr.State(None)
-        topic_titles = gr.State([c["title"] for c in conversations])
+        full_history = gr.State([])  # Whole active conversation; chat shows its tail
+        last_answer = gr.State("")  # Reply waiting to be spoken
+        topic_titles = gr.State(_topic_titles)
 
         with gr.Row(elem_id="jd-root"):
             # Sidebar
@@ -558,7 +879,7 @@ def build_ui():
                 gr.HTML("<div id='jd-logo'>JD</div>")
                 new_chat_btn = gr.Button(elem_id="jd-newchat", value="＋  New chat", size="sm")
                 topic_radio = gr.Radio(
-                    choices=[c["title"] for c in conversations],
+                    choices=_topic_titles,
                     label="Conversations",
                     elem_id="jd-topic-radio",
                     interactive=True,
@@ -597,31 +918,50 @@ def build_ui():
 
         # =============== EVENT HANDLERS ===============
 
-        def on_send(message, history, speak, conv_id, titles):
-            new_history, audio, new_conv_id, new_titles = jd_reply_core(
-                message, speak, history or [], conv_id
-            )
-            return (
-                new_history,
-                "",
-                gr.update(value=audio, visible=bool(audio)),
-                new_conv_id,
-                new_titles,
-                gr.update(choices=new_titles, value=new_titles[-1] if new_titles else None),
-            )
+        def on_send(message, history, conv_id, titles):
+            for new_history, answer, new_conv_id, new_titles in jd_reply_core(
+                message, history or [], conv_id
+            ):
+                if answer is None:
+                    # Still streaming (or nothing sent): only the chat changes
+                    yield (
+                        new_history[-DISPLAY_TURNS:],
+                        gr.update(),
+                        "",
+                        gr.update(),
+                        gr.update(),
+                        gr.update(),
+                        gr.update(),
+                        "",  # Server-side State; keeps on_speak from repeating an old reply
+                    )
+                    continue
+                yield (
+                    new_history[-DISPLAY_TURNS:],
+                    new_history,
+                    "",
+                    gr.update(value=None, visible=False),
+                    new_conv_id,
+                    new_titles,
+                    gr.update(choices=new_titles, value=new_titles[-1] if new_titles else None),
+                    answer,
+                )
+
+        def on_speak(answer, speak):
+            # Runs after on_send so the text reply is not held up by gTTS
+            audio = make_tts(answer) if speak else None
+            return gr.update(value=audio, visible=bool(audio))
 
         def on_new_chat(conv_id, titles):
-            return [], "", gr.update(value=None, visible=False), None, titles, gr.update(value=None)
+            return [], [], "", gr.update(value=None, visible=False), None, _topic_titles, gr.update(value=None)
 
         def on_select_topic(topic_title):
             if not topic_title:
-                return [], None
+                return [], [], None
             full_turns, cid = load_conversation_by_title(topic_title)
             if full_turns is None:
-                return [], None
-            # Show last 5 turns
-            last_five = full_turns[-5:]
-            return last_five, cid
+                return [], [], None
+            # Show only the last turns
+            return full_turns[-DISPLAY_TURNS:], full_turns, cid
 
         def edit_last_prompt(history):
             if not history:
@@ -638,25 +978,33 @@ def build_ui():
         # Wire up events
         send_btn.click(
             fn=on_send,
-            inputs=[txt, chat, tts_toggle, active_conv_id, topic_titles],
-            outputs=[chat, txt, audio_out, active_conv_id, topic_titles, topic_radio],
+            inputs=[txt, full_history, active_conv_id, topic_titles],
+            outputs=[chat, full_history, txt, audio_out, active_conv_id, topic_titles, topic_radio, last_answer],
+        ).then(
+            fn=on_speak,
+            inputs=[last_answer, tts_toggle],
+            outputs=[audio_out],
         )
         txt.submit(
             fn=on_send,
-            inputs=[txt, chat, tts_toggle, active_conv_id, topic_titles],
-            outputs=[chat, txt, audio_out, active_conv_id, topic_titles, topic_radio],
+            inputs=[txt, full_history, active_conv_id, topic_titles],
+            outputs=[chat, full_history, txt, audio_out, active_conv_id, topic_titles, topic_radio, last_answer],
+        ).then(
+            fn=on_speak,
+            inputs=[last_answer, tts_toggle],
+            outputs=[audio_out],
         )
 
         new_chat_btn.click(
             fn=on_new_chat,
             inputs=[active_conv_id, topic_titles],
-            outputs=[chat, txt, audio_out, active_conv_id, topic_titles, topic_radio],
+            outputs=[chat, full_history, txt, audio_out, active_conv_id, topic_titles, topic_radio],
         )
 
         topic_radio.input(
             fn=on_select_topic,
             inputs=topic_radio,
-            outputs=[chat, active_conv_id],
+            outputs=[chat, full_history, active_conv_id],
         )
 
         edit_last_btn.click(
@@ -698,7 +1046,7 @@ def main():
     
     # Check if Ollama is running
     try:
-        ollama.list()
+        CLIENT.list()
         print(f"✓ Ollama is running")
         print(f"✓ Using model: {MODEL_NAME}")
     except Exception as e: